@@ -1,7 +1,25 @@
-from .auth import ProductUpAuth
-from .models import Site
-from .projects import Projects
-from .sites import Sites
+import importlib
+
+# the modules are imported on first use, so that the command line tool
+# starts without loading requests and the API wrappers
+_exports = {
+    'ProductUpAuth': '.auth',
+    'Site': '.models',
+    'Pipeline': '.pipeline',
+    'ProductUpClientPool': '.pool',
+    'Projects': '.projects',
+    'Sites': '.sites',
+}
+
+__all__ = list(_exports)
 
 __version__ = '0.0.1'
 __author__ = 'Lyes Tarzalt'
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
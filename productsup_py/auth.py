@@ -1,16 +1,77 @@
 # Author: Lyes Tarzalt
 
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from typing import Union
+
 import requests
+from productsup_py.cache import CacheEntry, CachedResponse, RevalidationCache, decoded_size
 from productsup_py.errors.productup_exception import BadRequestError, UnauthorizedError, ForbiddenError, \
     NotFoundError, MethodNotAllowedError,\
-    NotAcceptableError, GoneError, InternalServerError
+    NotAcceptableError, GoneError, InternalServerError, RequestBudgetExceededError, TooManyRequestsError, \
+    ProductsUpError
+from productsup_py.resilience import CircuitBreaker, LatencyTracker, endpoint_family
+from productsup_py.tracing import Trace, activate_trace, active_traces
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (5, 60)
 
 
 class ProductUpAuth:
-    def __init__(self, client_id, client_secret):
+    def __init__(self, client_id, client_secret, timeout=DEFAULT_TIMEOUT, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0, hedge_requests: bool = False, hedge_delay: float = None,  # type: ignore
+                 hedge_percentile: float = 95, hedge_workers: int = 4, session: requests.Session = None,  # type: ignore
+                 pool=None, cache_entries: int = 0, cache_max_bytes: int = 32 * 1024 * 1024):
+        """
+        Args:
+            client_id (int): client id
+            client_secret (str): client secret
+            timeout (float | tuple, optional): requests timeout, a number or a (connect, read) tuple.
+                Defaults to DEFAULT_TIMEOUT.
+            failure_threshold (int, optional): consecutive failures before the circuit breaker of an
+                endpoint family opens. Defaults to 5.
+            recovery_timeout (float, optional): seconds an open circuit breaker rejects requests.
+                Defaults to 30.0.
+            hedge_requests (bool, optional): send a second copy of idempotent requests that are
+                slower than the hedge delay. Defaults to False.
+            hedge_delay (float, optional): fixed hedge delay in seconds, by default the
+                `hedge_percentile` of the observed latencies is used.
+            hedge_percentile (float, optional): latency percentile used as hedge delay. Defaults to 95.
+            hedge_workers (int, optional): second copies sent at the same time, no copy is sent
+                while they are all running. Defaults to 4.
+            session (requests.Session, optional): session to send the requests with, a new one
+                is created by default.
+            pool (ProductUpClientPool, optional): pool scheduling the requests of this client,
+                use ProductUpClientPool.client instead of setting it.
+            cache_entries (int, optional): responses kept to revalidate import history, channel
+                history and errors with If-None-Match/If-Modified-Since, 0 disables the cache.
+                Defaults to 0.
+            cache_max_bytes (int, optional): maximum memory used by the decoded cached
+                responses, estimated from their decoded size and not from the bytes
+                downloaded. Defaults to 32 MiB.
+        """
         self.token = f"{client_id}:{client_secret}"
+        self.client_id = client_id
 
-        self.session = requests.Session()
+        self.session = session if session is not None else requests.Session()
+        self.pool = pool
+        self.cache = RevalidationCache(cache_entries, cache_max_bytes) if cache_entries else None
+
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.hedge_requests = hedge_requests
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_workers = hedge_workers
+        self._breakers = {}
+        self._latencies = {}
+        self._hedge_executor = None
+        self._hedges_running = 0
+        self._lock = threading.Lock()
 
         self.status_code_exceptions = {
             400: BadRequestError,
@@ -26,7 +87,185 @@ class ProductUpAuth:
     def get_token(self) -> dict:
         return {"X-Auth-Token": self.token}
 
-    def make_request(self, url: str, method: str, data = None) -> requests.Response:
+    @property
+    def traces(self) -> list:
+        """Traces of this client opened in the current context."""
+        return active_traces(self)
+
+    @contextmanager
+    def trace(self, budget: int = None):  # type: ignore
+        """Record the requests made inside the block.
+
+        Only the requests made from this thread, or from work run in a copy of
+        its context, are recorded and counted against the budget. Requests
+        other threads make with the same client are not.
+
+        Example:
+            with pu_auth.trace(budget=20) as trace:
+                sites.get_site(1234)
+            print(trace.request_count)
+            trace.save_chrome_trace('get_site.json')
+
+        Args:
+            budget (int, optional): maximum number of requests, the next one raises
+                RequestBudgetExceededError. Defaults to no limit.
+
+        Yields:
+            Trace: the recorded operations and requests
+        """
+        trace = Trace(budget)
+        try:
+            with activate_trace(self, trace):
+                yield trace
+        finally:
+            trace.finish()
+
+    def get_circuit_breaker(self, family: str) -> CircuitBreaker:
+        with self._lock:
+            if family not in self._breakers:
+                self._breakers[family] = CircuitBreaker(
+                    family, self.failure_threshold, self.recovery_timeout)
+            return self._breakers[family]
+
+    def _get_latency_tracker(self, family: str) -> LatencyTracker:
+        with self._lock:
+            if family not in self._latencies:
+                self._latencies[family] = LatencyTracker()
+            return self._latencies[family]
+
+    def _send(self, family: str, url: str, method: str, headers: dict, data=None,
+              stream: bool = False, sent: threading.Event = None) -> requests.Response:  # type: ignore
+        if self.pool is not None:
+            with self.pool.slot(self.client_id):
+                return self._send_request(family, url, method, headers, data, stream, sent)
+        return self._send_request(family, url, method, headers, data, stream, sent)
+
+    def _send_request(self, family: str, url: str, method: str, headers: dict, data=None,
+                      stream: bool = False, sent: threading.Event = None) -> requests.Response:  # type: ignore
+        """Send one HTTP request, counted and recorded in the active traces.
+
+        Args:
+            sent (threading.Event, optional): set when the request is sent, after it
+                waited for the pool
+
+        Raises:
+            RequestBudgetExceededError: an active trace is over its budget, the request was not sent
+        """
+        traces = self.traces
+        for trace in traces:
+            trace.count_request(method, url)
+        bytes_sent = len(data) if isinstance(data, (str, bytes)) else 0
+        # validators are only sent for cached responses, a 304 is a cache hit
+        revalidated = "If-None-Match" in headers or "If-Modified-Since" in headers
+        start = time.perf_counter()
+        if sent is not None:
+            sent.set()
+        try:
+            response = self.session.request(
+                method.upper(), url=url, headers=headers, data=data, timeout=self.timeout, stream=stream)
+        except requests.RequestException:
+            for trace in traces:
+                trace.record_request(method, url, start, bytes_sent=bytes_sent)
+            raise
+        self._get_latency_tracker(family).add(time.perf_counter() - start)
+        spans = [(trace, trace.record_request(method, url, start, response, bytes_sent=bytes_sent,
+                                              cache_hit=revalidated and response.status_code == 304))
+                 for trace in traces]
+        if stream:
+            # the size of the body is only known once the caller has read it
+            response.trace_spans = spans
+        return response
+
+    def _submit_hedge(self, *args) -> Union[Future, None]:
+        """Send the hedge copy of a request on the hedge executor.
+
+        Returns:
+            Future: the copy, None if every hedge worker is busy
+        """
+        with self._lock:
+            if self._hedges_running >= self.hedge_workers:
+                return None
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self.hedge_workers, thread_name_prefix="productsup-hedge")
+            self._hedges_running += 1
+        # run in a copy of the context so that the request is recorded in the active traces
+        future = self._hedge_executor.submit(contextvars.copy_context().run, self._send, *args)
+        future.add_done_callback(self._hedge_done)
+        return future
+
+    def _hedge_done(self, future: Future) -> None:
+        with self._lock:
+            self._hedges_running -= 1
+
+    def _send_hedged(self, family: str, url: str, method: str, headers: dict, data=None,
+                     stream: bool = False) -> requests.Response:
+        """Send a request and, if it is still running after the hedge delay,
+        a second copy of it. The first successful response wins.
+
+        The first copy is sent right away on its own thread, only the second one
+        uses the hedge executor. The delay starts once the first copy is sent, the
+        time it waits for the pool does not count. No second copy is sent when
+        every hedge worker is busy.
+        """
+        delay = self.hedge_delay
+        if delay is None:
+            delay = self._get_latency_tracker(family).percentile(self.hedge_percentile)
+        if delay is None:
+            # not enough samples yet to know what a slow request is
+            return self._send(family, url, method, headers, data, stream)
+
+        # the caller's thread cannot give up on a request blocked on the socket, it
+        # waits for the first response while the first copy runs on its own thread
+        first, sent = Future(), threading.Event()
+        context = contextvars.copy_context()
+
+        def send_first():
+            try:
+                first.set_result(context.run(self._send, family, url, method, headers, data, stream, sent))
+            except BaseException as e:
+                first.set_exception(e)
+            finally:
+                sent.set()
+
+        threading.Thread(target=send_first, name="productsup-request", daemon=True).start()
+        sent.wait()
+        done, _ = wait([first], timeout=delay)
+        second = None if done else self._submit_hedge(family, url, method, headers, data, stream)
+        if second is None:
+            return first.result()
+        error = None
+        for future in as_completed([first, second]):
+            try:
+                return future.result()
+            except requests.RequestException as e:
+                error = e
+        raise error  # type: ignore
+
+    def _raise_streamed_error(self, response: requests.Response) -> None:
+        """Raise the error of a streamed response. Its body, often an HTML error
+        page of a proxy, is not the JSON the caller scans for and would read as
+        an empty list.
+
+        Raises:
+            self.status_code_exceptions: the status code is mapped
+            TooManyRequestsError: status code 429
+            ProductsUpError: any other error
+        """
+        text = response.text
+        for trace, span in getattr(response, 'trace_spans', ()):
+            trace.update_request(span, len(response.content))
+        response.close()
+        try:
+            message = response.json().get("message", text)
+        except (ValueError, AttributeError):
+            message = text
+        if response.status_code == 429:
+            raise TooManyRequestsError(response.status_code, message)
+        raise self.status_code_exceptions.get(response.status_code, ProductsUpError)(response.status_code, message)
+
+    def make_request(self, url: str, method: str, data = None, idempotent: bool = False,
+                     stream: bool = False, revalidate: bool = False) -> requests.Response:
 
         """Generic method to make requests to the API
 
@@ -34,25 +273,68 @@ class ProductUpAuth:
             url (str): url of the endpoint
             method (str): method of the request
             data (json):Json object
+            idempotent (bool, optional): the request can safely be sent twice, allows hedging.
+                Defaults to False.
+            stream (bool, optional): do not read the body of successful responses, it is read
+                by the caller with response.iter_content. Any status code from 400 raises.
+                Defaults to False.
+            revalidate (bool, optional): keep the decoded body of GET responses in the cache and
+                only download it again when it changed. The body returned by response.json()
+                is shared with the cache and must not be modified. Defaults to False.
 
         Raises:
             ValueError: 
+            CircuitOpenError: the endpoint family is failing, the request was not sent
+            RequestBudgetExceededError: an active trace is over its budget, the request was not sent
+            requests.Timeout: the request took longer than the timeout
             self.status_code_exceptions: any error that is not handled
 
         Returns:
-            requests.Response: Response object
+            requests.Response: Response object, CachedResponse when revalidated
         """        
         token = self.get_token()
-        if method == "get":
-            response = self.session.get(url=url, headers=token)
-        elif method == "post":
-            response = self.session.post(url=url, headers=token, data=data)
-        elif method == "put":
-            response = self.session.put(url=url, headers=token, data=data)
-        elif method == "delete":
-            response = self.session.delete(url=url, headers=token, data=data)
-        else:
+        if method not in ("get", "post", "put", "delete"):
             raise ValueError("Method not allowed")
+
+        cache_entry = None
+        revalidate = revalidate and self.cache is not None and method == "get" and not stream
+        if revalidate:
+            cache_entry = self.cache.get(url)  # type: ignore
+            if cache_entry is not None:
+                token = {**token, **self.cache.validators(cache_entry)}  # type: ignore
+
+        family = endpoint_family(url)
+        breaker = self.get_circuit_breaker(family)
+        breaker.before_request()
+        try:
+            if idempotent and self.hedge_requests:
+                response = self._send_hedged(family, url, method, token, data, stream)
+            else:
+                response = self._send(family, url, method, token, data, stream)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+        except RequestBudgetExceededError:
+            breaker.release()
+            raise
+        cache_hit = cache_entry is not None and response.status_code == 304
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if revalidate:
+            self.cache.record(cache_hit)  # type: ignore
+            if cache_hit:
+                return CachedResponse(response, cache_entry.body, from_cache=True)  # type: ignore
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            if response.status_code == 200 and (etag or last_modified):
+                response_body = response.json()
+                self.cache.put(url, CacheEntry(etag, last_modified, response_body, decoded_size(response_body)))  # type: ignore
+                return CachedResponse(response, response_body, from_cache=False)
+        if stream:
+            if response.status_code < 400:
+                return response
+            self._raise_streamed_error(response)
         # TodoL refactor this
         response_body = response.json()
         if response.status_code in self.status_code_exceptions:
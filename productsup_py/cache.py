@@ -0,0 +1,115 @@
+# Author: Lyes Tarzalt
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Union
+
+
+def decoded_size(body) -> int:
+    """Estimate the memory used by a decoded JSON body, in bytes.
+
+    Keys shared between the records are counted once per record, so the
+    estimate is rather on the high side.
+    """
+    size, values = 0, [body]
+    while values:
+        value = values.pop()
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            values.extend(value.keys())
+            values.extend(value.values())
+        elif isinstance(value, list):
+            values.extend(value)
+    return size
+
+
+@dataclass
+class CacheEntry:
+    etag: Union[str, None]
+    last_modified: Union[str, None]
+    body: Any
+    size: int
+
+
+class CachedResponse:
+    """Response whose decoded body comes from the RevalidationCache.
+
+    The body is shared with the cache and must not be modified.
+    """
+
+    def __init__(self, response, body, from_cache: bool) -> None:
+        self.response = response
+        self.status_code = 200 if from_cache else response.status_code
+        self.headers = response.headers
+        self.url = response.url
+        self.from_cache = from_cache
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class RevalidationCache:
+    """Keeps the validators (ETag, Last-Modified) and the decoded body of
+    GET responses by url. The least recently used entries are evicted when
+    there are more than `max_entries` entries or when the decoded bodies use
+    more than `max_bytes` of memory, as estimated by decoded_size.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> Union[CacheEntry, None]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def validators(self, entry: CacheEntry) -> dict:
+        """Get the conditional headers to revalidate an entry."""
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(self, url: str, entry: CacheEntry) -> None:
+        """Cache an entry in place of the previous one of the url. An entry
+        larger than max_bytes is not cached, the previous one is still removed
+        as its validators are outdated.
+        """
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self.size -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[url] = entry
+            self.size += entry.size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,189 @@
+# Author: Lyes Tarzalt
+"""Command line tool to run operations on many sites at once.
+
+Every command writes one JSON object per line on stdout. Site ids are read
+from the arguments, or from stdin (one per line) when none are given.
+
+    productsup sites 1234 5678
+    productsup errors --follow 1234
+    productsup trigger --action import < site_ids.txt
+    productsup wait 1234:0a1b2c...
+
+The heavy modules (requests, the API wrappers) are only imported once the
+command runs, so `productsup --help` stays fast.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# set on Ctrl-C, the polling loops of the workers stop when it is set
+_stop = threading.Event()
+
+
+def _json_default(value):
+    from dataclasses import asdict, is_dataclass
+    from datetime import datetime
+    from enum import Enum
+
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+def _write(record: dict) -> None:
+    sys.stdout.write(json.dumps(record, default=_json_default) + "\n")
+    sys.stdout.flush()
+
+
+def _read_items(items: list) -> list:
+    if items:
+        return items
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def _sites(args):
+    from productsup_py.pool import ProductUpClientPool
+    from productsup_py.sites import Sites
+
+    if not args.client_id or not args.client_secret:
+        raise SystemExit("Missing credentials: use --client-id/--client-secret or "
+                         "PRODUCTSUP_CLIENT_ID/PRODUCTSUP_CLIENT_SECRET")
+    pool = ProductUpClientPool(pool_maxsize=args.workers, max_concurrency=args.workers, rate=args.rate)
+    return Sites(pool.client(args.client_id, args.client_secret), stream=True)
+
+
+def _run_parallel(func, items: list, workers: int) -> int:
+    """Call func for each item on `workers` threads and write the records as
+    soon as they are ready. Items for which func returns None are not written.
+
+    Returns:
+        int: exit code, 1 if at least one item failed
+    """
+    from productsup_py.errors import ProductsUpError
+    import requests
+
+    exit_code = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except (ProductsUpError, requests.RequestException, ValueError) as e:
+                exit_code = 1
+                _write({"item": futures[future], "error": str(e), "type": type(e).__name__})
+            else:
+                if record is not None:
+                    _write(record)
+    except KeyboardInterrupt:
+        _stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return exit_code
+
+
+def dump_sites(args) -> int:
+    sites = _sites(args)
+    return _run_parallel(sites.get_site, _read_items(args.site_ids), args.workers)
+
+
+def tail_errors(args) -> int:
+    sites = _sites(args)
+    seen = set()
+
+    def new_errors(site_id):
+        errors = [error for error in sites.iter_errors(site_id) if (site_id, error.error_id) not in seen]
+        if not errors:
+            return None
+        seen.update((site_id, error.error_id) for error in errors)
+        return {"site_id": site_id, "errors": errors}
+
+    site_ids = _read_items(args.site_ids)
+    while True:
+        exit_code = _run_parallel(new_errors, site_ids, args.workers)
+        if not args.follow or _stop.wait(args.interval):
+            return exit_code
+
+
+def trigger(args) -> int:
+    sites = _sites(args)
+
+    def trigger_site(site_id):
+        return {"site_id": site_id, "action": args.action, "pid": sites.trigger_action(site_id, args.action)}
+
+    return _run_parallel(trigger_site, _read_items(args.site_ids), args.workers)
+
+
+def wait(args) -> int:
+    from productsup_py.pipeline import Pipeline
+
+    sites = _sites(args)
+
+    def wait_process(process):
+        site_id, _, pid = process.partition(':')
+        if not site_id or not pid:
+            raise ValueError(f"Expected SITE_ID:PID, got '{process}'")
+        start = time.monotonic()
+        while not _stop.is_set():
+            status = str(sites.get_status(site_id, pid)).lower()
+            if status in Pipeline.DONE_STATUSES or status in Pipeline.FAILED_STATUSES:
+                return {"site_id": site_id, "pid": pid, "status": status,
+                        "waited": round(time.monotonic() - start, 3)}
+            if args.timeout and time.monotonic() - start > args.timeout:
+                return {"site_id": site_id, "pid": pid, "status": status, "timeout": True}
+            _stop.wait(args.interval)
+
+    return _run_parallel(wait_process, _read_items(args.processes), args.workers)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="productsup", description="Bulk operations on ProductsUp sites.")
+    parser.add_argument("--client-id", default=os.environ.get("PRODUCTSUP_CLIENT_ID"))
+    parser.add_argument("--client-secret", default=os.environ.get("PRODUCTSUP_CLIENT_SECRET"))
+    parser.add_argument("--workers", type=int, default=4, help="requests sent at the same time (default: 4)")
+    parser.add_argument("--rate", type=float, default=None, help="max requests per second (default: no limit)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("sites", help="dump sites with their imports, channels and errors")
+    command.add_argument("site_ids", nargs="*")
+    command.set_defaults(func=dump_sites)
+
+    command = commands.add_parser("errors", help="print the errors of sites")
+    command.add_argument("site_ids", nargs="*")
+    command.add_argument("--follow", action="store_true", help="keep polling and print new errors")
+    command.add_argument("--interval", type=float, default=60, help="seconds between polls (default: 60)")
+    command.set_defaults(func=tail_errors)
+
+    command = commands.add_parser("trigger", help="trigger an action on sites")
+    command.add_argument("site_ids", nargs="*")
+    command.add_argument("--action", choices=("import", "export-all", "all"), default="all")
+    command.set_defaults(func=trigger)
+
+    command = commands.add_parser("wait", help="wait for processes given as SITE_ID:PID")
+    command.add_argument("processes", nargs="*")
+    command.add_argument("--interval", type=float, default=10, help="seconds between polls (default: 10)")
+    command.add_argument("--timeout", type=float, default=None, help="give up after this many seconds")
+    command.set_defaults(func=wait)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    _stop.clear()
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -92,3 +92,17 @@ class TooManyRequestsError(ProductsUpError):
     def __str__(self):
         return f"Code:{self.status_code} Too many requests."
     pass
+
+
+class CircuitOpenError(ProductsUpError):
+    """The API is failing, requests are rejected until it recovers"""
+
+    def __str__(self):
+        return f"{self.message}"
+
+
+class RequestBudgetExceededError(ProductsUpError):
+    """An operation made more requests than its budget allows"""
+
+    def __str__(self):
+        return f"{self.message}"
@@ -2,7 +2,7 @@
 from dataclasses import dataclass, field
 from enum import Enum
 from datetime import datetime
-from typing import Union
+from typing import Any, Union
 
 """ Each dataclass is a model of the data returned by the API
 """
@@ -113,3 +113,16 @@ class Site:
     errors: list[SiteError] = field(default_factory=list)
     channels: list[SiteChannel] = field(default_factory=list)
     links: Union[list, None] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class BatchResult:
+    """Result of one item of a batch operation."""
+
+    item: Any
+    result: Any = None
+    error: Union[Exception, None] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
@@ -0,0 +1,267 @@
+# Author: Lyes Tarzalt
+import time
+from dataclasses import dataclass, field
+from typing import Union
+
+import requests
+
+import productsup_py.errors as pex
+from productsup_py.pool import RateLimiter
+
+
+@dataclass
+class Stage:
+    """A site action of a pipeline.
+
+    Times are in seconds since the start of the pipeline.
+    """
+
+    name: str
+    site_id: int
+    action: str = 'all'
+    depends_on: list = field(default_factory=list)
+    status: str = 'pending'  # pending, running, done, failed or skipped
+    pid: Union[str, None] = None
+    ready_at: Union[float, None] = None
+    started_at: Union[float, None] = None
+    finished_at: Union[float, None] = None
+    attempts: int = 0
+    error: Union[str, None] = None
+
+    @property
+    def duration(self) -> Union[float, None]:
+        """Time between the trigger and the end of the process."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def wait(self) -> Union[float, None]:
+        """Time between the end of the dependencies and the trigger."""
+        if self.ready_at is None or self.started_at is None:
+            return None
+        return self.started_at - self.ready_at
+
+
+@dataclass
+class PipelineReport:
+
+    stages: dict
+    critical_path: list
+    duration: float
+
+    @property
+    def failed(self) -> list:
+        return [stage for stage in self.stages.values() if stage.status in ('failed', 'skipped')]
+
+
+class Pipeline:
+    """Runs a DAG of site actions, each action is triggered as soon as the
+    actions it depends on are done.
+
+    Example:
+        pipeline = Pipeline(Sites(pu_auth), rate=2)
+        pipeline.add_stage('import_a', 1234, 'import')
+        pipeline.add_stage('export_b', 5678, 'export-all', depends_on=['import_a'])
+        report = pipeline.run()
+        print(report.critical_path)
+    """
+
+    ACTIONS = ("import", "export-all", "all")
+    DONE_STATUSES = ("success", "done", "finished", "completed")
+    FAILED_STATUSES = ("failed", "error", "aborted", "cancelled")
+
+    def __init__(self, sites, max_running: int = 10, rate: float = 1.0,
+                 poll_interval: float = 5.0, max_poll_interval: float = 60.0,
+                 max_attempts: int = 5, stage_timeout: float = None, timeout: float = None) -> None:  # type: ignore
+        """
+        A stage that fails or times out is only marked failed, its process is
+        not stopped on the platform.
+
+        Args:
+            sites (Sites): Sites object used to trigger and poll the actions
+            max_running (int, optional): actions running at the same time. Defaults to 10.
+            rate (float, optional): API requests per second made by the pipeline. Defaults to 1.0.
+            poll_interval (float, optional): seconds between two status polls. Defaults to 5.0.
+            max_poll_interval (float, optional): the poll interval grows up to this value while
+                no action finishes. Defaults to 60.0.
+            max_attempts (int, optional): triggers of a stage rejected because of rate limiting,
+                a queued process, an open circuit breaker or a network error before the stage
+                fails. Defaults to 5.
+            stage_timeout (float, optional): seconds a stage can run before it fails.
+                Defaults to no limit.
+            timeout (float, optional): seconds the whole pipeline can run, the stages still
+                pending or running then fail. Defaults to no limit.
+        """
+        self.sites = sites
+        self.max_attempts = max_attempts
+        self.stage_timeout = stage_timeout
+        self.timeout = timeout
+        self.max_running = max_running
+        self.rate_limiter = RateLimiter(rate)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.stages = {}
+
+    def add_stage(self, name: str, site_id: int, action: str = 'all', depends_on=()) -> Stage:
+        """Add an action to the pipeline.
+
+        Args:
+            name (str): unique name of the stage
+            site_id (int): site to trigger the action for
+            action (str, optional): "import", "export-all" or "all". Defaults to 'all'.
+            depends_on (list, optional): names of the stages that must be done first.
+
+        Raises:
+            ValueError: invalid action or duplicated name
+
+        Returns:
+            Stage: the stage added
+        """
+        if action not in Pipeline.ACTIONS:
+            raise ValueError(f"Action not allowed: {action}")
+        if name in self.stages:
+            raise ValueError(f"Stage already exists: {name}")
+        stage = Stage(name=name, site_id=site_id, action=action, depends_on=list(depends_on))
+        self.stages[name] = stage
+        return stage
+
+    def _check_dependencies(self) -> None:
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Unknown dependency '{dependency}' of stage '{stage.name}'")
+        visited, in_path = set(), set()
+
+        def visit(name):
+            if name in in_path:
+                raise ValueError(f"Dependency cycle on stage '{name}'")
+            if name in visited:
+                return
+            in_path.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            in_path.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _trigger_ready_stages(self, start: float) -> None:
+        running = sum(1 for stage in self.stages.values() if stage.status == 'running')
+        for stage in self.stages.values():
+            if stage.status != 'pending':
+                continue
+            dependencies = [self.stages[name] for name in stage.depends_on]
+            if any(dependency.status in ('failed', 'skipped') for dependency in dependencies):
+                stage.status = 'skipped'
+                continue
+            if not all(dependency.status == 'done' for dependency in dependencies):
+                continue
+            if stage.ready_at is None:
+                stage.ready_at = max([d.finished_at for d in dependencies],  # type: ignore
+                                     default=time.monotonic() - start)
+            if running >= self.max_running:
+                continue
+            self.rate_limiter.acquire()
+            stage.attempts += 1
+            try:
+                stage.pid = self.sites.trigger_action(stage.site_id, stage.action)
+            except (pex.TooManyRequestsError, pex.CircuitOpenError, requests.RequestException) as e:
+                # a process is already queued for the site, the circuit breaker is open
+                # or the request did not go through, try again on the next round
+                if stage.attempts >= self.max_attempts:
+                    self._fail(stage, time.monotonic() - start, f"Trigger failed {stage.attempts} times: {e}")
+                continue
+            except pex.ProductsUpError as e:
+                self._fail(stage, time.monotonic() - start, str(e))
+                continue
+            stage.status = 'running'
+            stage.started_at = time.monotonic() - start
+            running += 1
+
+    def _poll_running_stages(self, start: float) -> bool:
+        """Poll the running stages.
+
+        Args:
+            start (float): time.monotonic() when the pipeline started
+
+        Returns:
+            bool: True if at least one stage finished
+        """
+        finished = False
+        for stage in self.stages.values():
+            if stage.status != 'running':
+                continue
+            self.rate_limiter.acquire()
+            try:
+                status = str(self.sites.get_status(stage.site_id, stage.pid)).lower()
+            except (pex.ProductsUpError, requests.RequestException):
+                # poll it again on the next round
+                status = None
+            now = time.monotonic() - start
+            if status in Pipeline.DONE_STATUSES:
+                stage.status = 'done'
+                stage.finished_at = now
+            elif status in Pipeline.FAILED_STATUSES:
+                self._fail(stage, now, f"Process {status}")
+            elif self.stage_timeout is not None and now - stage.started_at > self.stage_timeout:  # type: ignore
+                self._fail(stage, now, f"Timed out after {self.stage_timeout}s, last status: {status}")
+            else:
+                continue
+            finished = True
+        return finished
+
+    @staticmethod
+    def _fail(stage: Stage, now: float, error: str) -> None:
+        stage.status = 'failed'
+        stage.finished_at = now
+        stage.error = error
+
+    def critical_path(self) -> list:
+        """Get the chain of stages that determined the end of the pipeline,
+        following from the last stage the dependency that finished last.
+
+        Returns:
+            list[str]: names of the stages, first stage first
+        """
+        finished = [stage for stage in self.stages.values() if stage.finished_at is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda s: s.finished_at)
+        path = [stage.name]
+        while stage.depends_on:
+            stage = max((self.stages[name] for name in stage.depends_on),
+                        key=lambda s: s.finished_at or 0)
+            path.append(stage.name)
+        return path[::-1]
+
+    def run(self) -> PipelineReport:
+        """Run the pipeline until every stage is done, failed or skipped.
+
+        Raises:
+            ValueError: unknown dependency or dependency cycle
+
+        Returns:
+            PipelineReport: stages with their timings and the critical path
+        """
+        self._check_dependencies()
+        start = time.monotonic()
+        interval = self.poll_interval
+        while any(stage.status in ('pending', 'running') for stage in self.stages.values()):
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                for stage in self.stages.values():
+                    if stage.status in ('pending', 'running'):
+                        self._fail(stage, time.monotonic() - start, f"Pipeline timed out after {self.timeout}s")
+                break
+            self._trigger_ready_stages(start)
+            if self._poll_running_stages(start):
+                # start the downstream stages right away
+                interval = self.poll_interval
+                continue
+            time.sleep(interval if self.timeout is None
+                       else max(0, min(interval, self.timeout - (time.monotonic() - start))))
+            interval = min(interval * 1.5, self.max_poll_interval)
+
+        return PipelineReport(stages=self.stages, critical_path=self.critical_path(),
+                              duration=time.monotonic() - start)
@@ -0,0 +1,139 @@
+# Author: Lyes Tarzalt
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from productsup_py.auth import ProductUpAuth
+
+
+class RateLimiter:
+    """Token bucket limiting the number of requests per second."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        Args:
+            rate (float): requests per second
+            burst (int, optional): requests that can be sent at once. Defaults to 1.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request can be sent."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # the token is reserved even if we have to wait for it
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait_time:
+            time.sleep(wait_time)
+
+
+class FairScheduler:
+    """Limits the number of requests in flight and hands free slots to the
+    waiting tenants in turn, so a busy tenant cannot starve the others."""
+
+    def __init__(self, max_concurrency: int) -> None:
+        self.max_concurrency = max_concurrency
+        self._available = max_concurrency
+        # tenant -> waiting tickets, the first tenant is the next one served
+        self._waiting = OrderedDict()
+        self._granted = set()
+        self._cond = threading.Condition()
+
+    def acquire(self, tenant) -> None:
+        with self._cond:
+            if self._available > 0 and not self._waiting:
+                self._available -= 1
+                return
+            ticket = object()
+            self._waiting.setdefault(tenant, deque()).append(ticket)
+            while ticket not in self._granted:
+                self._cond.wait()
+            self._granted.discard(ticket)
+
+    def release(self) -> None:
+        with self._cond:
+            if not self._waiting:
+                self._available += 1
+                return
+            tenant, tickets = next(iter(self._waiting.items()))
+            self._granted.add(tickets.popleft())
+            if tickets:
+                self._waiting.move_to_end(tenant)
+            else:
+                del self._waiting[tenant]
+            self._cond.notify_all()
+
+
+class ProductUpClientPool:
+    """Shares one connection pool, one rate limit and one concurrency budget
+    between the clients of many ProductsUp accounts.
+
+    Example:
+        pool = ProductUpClientPool(max_concurrency=8, rate=20)
+        shop_a = Sites(pool.client(1234, 'secret_a'))
+        shop_b = Sites(pool.client(5678, 'secret_b'))
+    """
+
+    def __init__(self, pool_maxsize: int = 20, max_concurrency: int = 10,
+                 rate: float = None, burst: int = 1, **auth_kwargs) -> None:  # type: ignore
+        """
+        Args:
+            pool_maxsize (int, optional): connections kept open to the API. Defaults to 20.
+            max_concurrency (int, optional): requests in flight for all tenants. Defaults to 10.
+            rate (float, optional): requests per second for all tenants. Defaults to no limit.
+            burst (int, optional): requests that can be sent at once under the rate limit. Defaults to 1.
+            auth_kwargs: arguments passed to every ProductUpAuth (timeout, hedge_requests...)
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.scheduler = FairScheduler(max_concurrency)
+        self.rate_limiter = RateLimiter(rate, burst) if rate else None
+        self.auth_kwargs = auth_kwargs
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, client_id, client_secret) -> ProductUpAuth:
+        """Get the client of an account, created on first use.
+
+        Args:
+            client_id (int): client id
+            client_secret (str): client secret
+
+        Returns:
+            ProductUpAuth: client using the shared pool
+        """
+        with self._lock:
+            key = (client_id, client_secret)
+            if key not in self._clients:
+                self._clients[key] = ProductUpAuth(
+                    client_id, client_secret, session=self.session, pool=self, **self.auth_kwargs)
+            return self._clients[key]
+
+    @contextmanager
+    def slot(self, tenant):
+        """Wait for the turn of a tenant to send a request."""
+        self.scheduler.acquire(tenant)
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            yield
+        finally:
+            self.scheduler.release()
+
+    def close(self) -> None:
+        self.session.close()
@@ -1,8 +1,15 @@
 # Author: Lyes Tarzalt
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from dataclasses import dataclass, field
 import json
-from typing import List
+import threading
+import time
+from typing import Callable, List, Union
+import requests
 from productsup_py.errors.productup_exception import ProductsUpError
+from productsup_py.models import BatchResult
+from productsup_py.tracing import traced
 from datetime import datetime
 
 
@@ -14,12 +21,49 @@ class Project:
     links: List = field(repr=False)
 
 
+@dataclass
+class ProjectSitesIndex:
+    """Projects of the account and the sites they contain, built from one
+    listing of the projects and one of the sites.
+
+    Project ids are stored as strings.
+    """
+
+    projects: dict
+    sites: dict
+    site_projects: dict
+    built_at: float = field(default_factory=time.monotonic)
+
+    def get_project(self, project_id) -> Union[Project, None]:
+        return self.projects.get(str(project_id))
+
+    def get_sites(self, project_id) -> list:
+        """Get the ids of the sites of a project."""
+        return self.sites.get(str(project_id), [])
+
+    def get_site_project(self, site_id) -> Union[Project, None]:
+        """Get the project a site belongs to."""
+        project_id = self.site_projects.get(str(site_id))
+        return self.get_project(project_id) if project_id is not None else None
+
+
 class Projects:
 
     BASE_URL = "https://platform-api.productsup.io/platform/v2/projects"
+    SITES_URL = "https://platform-api.productsup.io/platform/v2/sites"
 
-    def __init__(self, auth) -> None:
+    def __init__(self, auth, index_ttl: float = 300) -> None:
+        """
+        Args:
+            auth (ProductUpAuth): client
+            index_ttl (float, optional): seconds the project to sites index is kept. Defaults to 300.
+        """
         self.auth = auth
+        self.index_ttl = index_ttl
+        self._index = None
+        self._index_lock = threading.Lock()
+        # held while the index is built, concurrent callers wait for it instead of building it again
+        self._build_lock = threading.Lock()
 
     @staticmethod
     def str_to_datetime(date: str) -> datetime:
@@ -38,6 +82,7 @@ class Projects:
         except TypeError:
             return datetime(1970, 1, 1)
 
+    @traced
     def list_all_projects(self) -> list[Project]:
         """Lists all or one projects in your account .
 
@@ -58,6 +103,7 @@ class Projects:
 
         return [Project(**project_data) for project_data in projects_data]
 
+    @traced
     def get_project(self, project_id: int) -> Project:
         """Get a specific project by its ID.
 
@@ -71,7 +117,7 @@ class Projects:
             Project: Project object
         """
         _url = f"{Projects.BASE_URL}/{project_id}"
-        response = self.auth.make_request(_url, method='get')
+        response = self.auth.make_request(_url, method='get', idempotent=True)
         response_body = response.json()
 
         if not response_body.get('success', False):
@@ -81,6 +127,7 @@ class Projects:
             'id'), **project_data} for project_data in response_body.get("Projects")]
         return Project(**projects_data[0])
 
+    @traced
     def create_project(self, project_name: str) -> Project:
         """Create a new project.
 
@@ -103,10 +150,12 @@ class Projects:
         if not response_body.get("success", False):
             raise ProductsUpError(response.status_code,
                                   response_body["message"])
+        self.clear_index()
         projects_data = [{'project_id': project_data.pop(
             'id'), **project_data} for project_data in response_body.get("Projects")]
         return Project(**projects_data[0])
 
+    @traced
     def update_project(self, project_id, name: str):
         """Update a project.
 
@@ -124,13 +173,15 @@ class Projects:
         response = self.auth.make_request(
             url, method='put', data=json.dumps({"name": name}))
         response_body = response.json()
-        if not response.get("success", False):
+        if not response_body.get("success", False):
             raise ProductsUpError(response.status_code,
                                   response_body.get("message"))
+        self.clear_index()
         projects_data = [{'project_id': project_data.pop(
             'id'), **project_data} for project_data in response_body.get("Projects")]
         return Project(**projects_data[0])
 
+    @traced
     def delete_project(self, project_id) -> bool:
         """Delete a project.
 
@@ -149,5 +200,159 @@ class Projects:
         if not response_body.get("success", False):
             raise ProductsUpError(response.status_code,
                                   response_body.get("message"))
-
+        self.clear_index()
         return True
+
+    @staticmethod
+    def _run_batch(func: Callable, items: list, max_workers: int) -> List[BatchResult]:
+        """Call func for each item in parallel, errors are kept in the results.
+
+        Args:
+            func (Callable): function called with each item
+            items (list): arguments, a tuple is unpacked
+            max_workers (int): calls running at the same time
+
+        Returns:
+            list[BatchResult]: one result per item, in the order of the items
+        """
+        def run(item) -> BatchResult:
+            try:
+                result = func(*item) if isinstance(item, tuple) else func(item)
+            except (ProductsUpError, requests.RequestException, ValueError) as e:
+                # ValueError: the response is not valid JSON
+                return BatchResult(item=item, error=e)
+            return BatchResult(item=item, result=result)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # each item runs in a copy of the context so that it is recorded in the active traces
+            futures = [executor.submit(contextvars.copy_context().run, run, item) for item in items]
+            return [future.result() for future in futures]
+
+    def create_projects(self, project_names: List[str], max_workers: int = 4) -> List[BatchResult]:
+        """Create several projects.
+
+        Args:
+            project_names (list[str]): Project names
+            max_workers (int, optional): requests sent at the same time. Defaults to 4.
+
+        Returns:
+            list[BatchResult]: the created Project or the error, for each name
+        """
+        results = self._run_batch(self.create_project, list(project_names), max_workers)
+        self.clear_index()
+        return results
+
+    def update_projects(self, names: dict, max_workers: int = 4) -> List[BatchResult]:
+        """Rename several projects.
+
+        Args:
+            names (dict): new name by project id
+            max_workers (int, optional): requests sent at the same time. Defaults to 4.
+
+        Returns:
+            list[BatchResult]: the updated Project or the error, item is (project_id, name)
+        """
+        results = self._run_batch(self.update_project, list(names.items()), max_workers)
+        self.clear_index()
+        return results
+
+    def delete_projects(self, project_ids: list, max_workers: int = 4) -> List[BatchResult]:
+        """Delete several projects.
+
+        Args:
+            project_ids (list): project ids
+            max_workers (int, optional): requests sent at the same time. Defaults to 4.
+
+        Returns:
+            list[BatchResult]: True or the error, for each project id
+        """
+        results = self._run_batch(self.delete_project, list(project_ids), max_workers)
+        self.clear_index()
+        return results
+
+    @traced
+    def build_index(self) -> ProjectSitesIndex:
+        """List the projects and the sites of the account and index the sites
+        by project. The index is cached for index_ttl seconds.
+
+        Raises:
+            ProductsUpError
+
+        Returns:
+            ProjectSitesIndex: project to sites index
+        """
+        projects = {str(project.project_id): project for project in self.list_all_projects()}
+
+        response = self.auth.make_request(Projects.SITES_URL, method='get')
+        response_body = response.json()
+        if not response_body.get("success", False):
+            raise ProductsUpError(response.status_code, response_body.get("message"))
+
+        sites, site_projects = {}, {}
+        for site_data in response_body.get("Sites", []):
+            project_id = str(site_data.get('project_id'))
+            sites.setdefault(project_id, []).append(site_data['id'])
+            site_projects[str(site_data['id'])] = project_id
+
+        index = ProjectSitesIndex(projects=projects, sites=sites, site_projects=site_projects)
+        with self._index_lock:
+            self._index = index
+        return index
+
+    def get_index(self, refresh: bool = False) -> ProjectSitesIndex:
+        """Get the cached project to sites index, built if missing or expired.
+
+        Args:
+            refresh (bool, optional): rebuild the index. Defaults to False.
+
+        Returns:
+            ProjectSitesIndex: project to sites index
+        """
+        with self._index_lock:
+            index = self._index
+        if not refresh and index is not None and time.monotonic() - index.built_at <= self.index_ttl:
+            return index
+        with self._build_lock:
+            with self._index_lock:
+                built = self._index
+            if built is not None and built is not index and time.monotonic() - built.built_at <= self.index_ttl:
+                # built by another caller while this one waited
+                return built
+            return self.build_index()
+
+    def clear_index(self) -> None:
+        with self._index_lock:
+            self._index = None
+
+    def get_project_sites(self, project_id) -> list:
+        """Get the ids of the sites of a project, from the cached index.
+
+        Args:
+            project_id (int): project id
+
+        Returns:
+            list: site ids
+        """
+        return self.get_index().get_sites(project_id)
+
+    def get_cached_project(self, project_id, build_index: bool = False) -> Project:
+        """Get a project from the index if it is built, from the API otherwise.
+
+        Args:
+            project_id (int): project id
+            build_index (bool, optional): build the index if it is missing or expired,
+                instead of requesting the project alone. Defaults to False.
+
+        Returns:
+            Project: Project object
+        """
+        if build_index:
+            index = self.get_index()
+        else:
+            with self._index_lock:
+                index = self._index
+        if index is not None and time.monotonic() - index.built_at <= self.index_ttl:
+            project = index.get_project(project_id)
+            if project is not None:
+                return project
+        return self.get_project(project_id)
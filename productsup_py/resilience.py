@@ -0,0 +1,116 @@
+# Author: Lyes Tarzalt
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from productsup_py.errors.productup_exception import CircuitOpenError
+
+
+def endpoint_family(url: str) -> str:
+    """Get the endpoint family of an url, used to group circuit breakers
+    and latency samples.
+
+    https://platform-api.productsup.io/platform/v2/sites/1/errors -> "sites"
+
+    Args:
+        url (str): url of the endpoint
+
+    Returns:
+        str: endpoint family
+    """
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if 'v2' in parts:
+        parts = parts[parts.index('v2') + 1:]
+    return parts[0] if parts else ''
+
+
+class CircuitBreaker:
+    """Fail fast while an endpoint family is unhealthy.
+
+    The breaker opens after `failure_threshold` consecutive failures and
+    rejects every call for `recovery_timeout` seconds. After that a single
+    trial call is let through (half open): a success closes the breaker,
+    a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Check that a request may be sent.
+
+        Raises:
+            CircuitOpenError: the breaker is open
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            if self.state == CircuitBreaker.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    raise CircuitOpenError(message=f"Circuit open for '{self.name}'")
+                self.state = CircuitBreaker.HALF_OPEN
+                self._trial_running = False
+            if self._trial_running:
+                raise CircuitOpenError(message=f"Circuit half open for '{self.name}'")
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CircuitBreaker.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def release(self) -> None:
+        """The request allowed by before_request was not sent."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == CircuitBreaker.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Keeps the last response times of an endpoint family to compute the
+    delay after which a hedged request is sent."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float):
+        """Get a percentile of the recorded latencies.
+
+        Args:
+            percent (float): percentile between 0 and 100
+
+        Returns:
+            float: latency in seconds, None if there are not enough samples
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
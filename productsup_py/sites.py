@@ -4,16 +4,34 @@ import productsup_py.errors as pex
 from productsup_py.projects import Projects
 from productsup_py.models import SiteStatus, SiteProcessingStatus, \
     SiteImport, SiteChannelHistory, SiteChannel, SiteError, Site, Project
+from productsup_py.cache import CachedResponse
+from productsup_py.streaming import iter_json_array
+from productsup_py.tracing import traced
 from datetime import datetime
+from typing import Iterator
 import json
 
 
 class Sites:
     BASE_URL = 'https://platform-api.productsup.io/platform/v2'
 
-    def __init__(self, auth) -> None:
+    def __init__(self, auth, stream: bool = False, projects: Projects = None,  # type: ignore
+                 use_index: bool = False) -> None:
+        """
+        Args:
+            auth (ProductUpAuth): client
+            stream (bool, optional): decode import history, channel history and errors
+                record by record while they are downloaded, the memory used does not
+                grow with the size of the response. Defaults to False.
+            projects (Projects, optional): Projects object used to resolve the project of
+                the sites, share it to share its project to sites index. Defaults to a new one.
+            use_index (bool, optional): resolve projects from the project to sites index,
+                built on first use, instead of one request per site. Defaults to False.
+        """
         self.auth = auth
-        self.projects = Projects(auth)
+        self.projects = projects if projects is not None else Projects(auth)
+        self.stream = stream
+        self.use_index = use_index
 
     @staticmethod
     def str_to_datetime(date: str) -> datetime:
@@ -32,6 +50,110 @@ class Sites:
         except TypeError:
             return datetime(1970, 1, 1)
 
+    def _stream_records(self, url: str, path: tuple) -> Iterator[dict]:
+        """Yield the records of a list of the response one by one
+
+        !Internal method
+
+        Args:
+            url (str): url of the endpoint
+            path (tuple): keys and indexes leading to the list in the response
+
+        Yields:
+            dict: record
+        """
+        response = self.auth.make_request(url, method='get', stream=True)
+        try:
+            yield from iter_json_array(response, path)
+        finally:
+            # the body is read now, record its size in the traces
+            for trace, span in getattr(response, 'trace_spans', ()):
+                trace.update_request(span, response.raw.tell())
+            response.close()
+
+    @staticmethod
+    def _rename_keys(record: dict, renames: dict, shared: bool) -> dict:
+        """Rename the keys of a record
+
+        !Internal method
+
+        Args:
+            record (dict): decoded record
+            renames (dict): new key by old key
+            shared (bool): the record is shared with the revalidation cache of auth,
+                a renamed copy is returned instead of renaming the keys in place
+
+        Returns:
+            dict: record with the renamed keys
+        """
+        if shared:
+            return {renames.get(key, key): value for key, value in record.items()}
+        for old_key, new_key in renames.items():
+            if old_key in record:
+                record[new_key] = record.pop(old_key)
+        return record
+
+    def _to_channel_history(self, channel_history: dict, shared: bool = False) -> SiteChannelHistory:
+        channel_history = self._rename_keys(channel_history, {'id': 'history_id'}, shared)
+        return SiteChannelHistory(**channel_history)
+
+    def _to_error(self, error: dict, shared: bool = False) -> SiteError:
+        # rename datetime to error_datetime because datetime is we have a class with the same name
+        error = self._rename_keys(error, {'id': 'error_id', 'datetime': 'error_datetime'}, shared)
+        if error.get('error_datetime'):
+            error['error_datetime'] = self.str_to_datetime(error['error_datetime'])
+        return SiteError(**error)
+
+    def _to_import(self, import_: dict, shared: bool = False) -> SiteImport:
+        import_ = self._rename_keys(import_, {'id': 'import_id'}, shared)
+        import_['import_time'] = self.str_to_datetime(import_['import_time'])
+        import_['import_time_utc'] = self.str_to_datetime(import_['import_time_utc'])
+        return SiteImport(**import_)
+
+    @traced
+    def iter_channel_history(self, site_id: int, channel_id: int) -> Iterator[SiteChannelHistory]:
+        """Get the history of a channel, decoded while it is downloaded.
+
+        Args:
+            site_id (int): Site id
+            channel_id (int): Channel id
+
+        Yields:
+            SiteChannelHistory: history record
+        """
+        _url = f"{Sites.BASE_URL}/sites/{site_id}/channels/{channel_id}/history"
+        for channel_history in self._stream_records(_url, ('Channels', 0, 'history')):
+            yield self._to_channel_history(channel_history)
+
+    @traced
+    def iter_errors(self, site_id: int) -> Iterator[SiteError]:
+        """Get last errors for a site, decoded while they are downloaded.
+
+        Args:
+            site_id (int): Site id
+
+        Yields:
+            SiteError: error
+        """
+        _url = f"{Sites.BASE_URL}/sites/{site_id}/errors"
+        for error in self._stream_records(_url, ('Errors',)):
+            yield self._to_error(error)
+
+    @traced
+    def iter_imports(self, site_id: int) -> Iterator[SiteImport]:
+        """Get last imports for a site, decoded while they are downloaded.
+
+        Args:
+            site_id (int): Site id
+
+        Yields:
+            SiteImport: import
+        """
+        url = f"{Sites.BASE_URL}/sites/{site_id}/importhistory"
+        for import_ in self._stream_records(url, ('Importhistory',)):
+            yield self._to_import(import_)
+
+    @traced
     def _get_channels(self, site_id: int) -> list[SiteChannel]:
         """gets all channels for a site
         
@@ -60,7 +182,8 @@ class Sites:
             channel_data.append(channel)
         return [SiteChannel(**channel) for channel in channel_data]
 
-    def _get_channel_history(self, site_id: int, channel_id: int) -> list[SiteChannelHistory]:
+    @traced
+    def _get_channel_history(self, site_id: int, channel_id: int, stream: bool = None) -> list[SiteChannelHistory]:  # type: ignore
         """Get the history of a channel
         
         !Internal method
@@ -68,6 +191,7 @@ class Sites:
         Args:
             site_id (int): Site id
             channel_id (int): Channel id
+            stream (bool, optional): decode the response while it is downloaded. Defaults to self.stream.
 
         Raises:
             pex.ProductsUpError: 
@@ -75,26 +199,30 @@ class Sites:
         Returns:
             list[SiteChannelHistory]: List of SiteChannelHistory objects
         """
+        if stream is None:
+            stream = self.stream
+        if stream:
+            return list(self.iter_channel_history(site_id, channel_id))
 
         _url = f"{Sites.BASE_URL}/sites/{site_id}/channels/{channel_id}/history"
-        response = self.auth.make_request(_url, method='get')
+        response = self.auth.make_request(_url, method='get', revalidate=True)
         response_body = response.json()
         if not response_body.get("success", False):
-            raise pex.ProductsUpError(response_body["message"])
+            raise pex.ProductsUpError(response.status_code, response_body.get("message"))
 
-        channel_history_data = []
-        for channel_history in response_body.get('Channels')[0].get('history'):
-            channel_history['history_id'] = channel_history.pop('id')
-            channel_history_data.append(channel_history)
-        return [SiteChannelHistory(**channel_history) for channel_history in channel_history_data]
+        shared = isinstance(response, CachedResponse)
+        return [self._to_channel_history(channel_history, shared)
+                for channel_history in response_body.get('Channels')[0].get('history')]
 
-    def _get_errors(self, site_id: int) -> list[SiteError]:
+    @traced
+    def _get_errors(self, site_id: int, stream: bool = None) -> list[SiteError]:  # type: ignore
         """Get last errors for a site
         
         !Internal method
         
         Args:
             site_id (int): Site id
+            stream (bool, optional): decode the response while it is downloaded. Defaults to self.stream.
 
         Raises:
             pex.ProductsUpError: 
@@ -102,31 +230,29 @@ class Sites:
         Returns:
             list[SiteError]: List of SiteError objects
         """        
+        if stream is None:
+            stream = self.stream
+        if stream:
+            return list(self.iter_errors(site_id))
+
         _url = f"{Sites.BASE_URL}/sites/{site_id}/errors"
-        response = self.auth.make_request(_url, method='get')
+        response = self.auth.make_request(_url, method='get', revalidate=True)
         response_body = response.json()
         if not response_body.get("success", False):
-            raise pex.ProductsUpError(response["error"])
+            raise pex.ProductsUpError(response.status_code, response_body.get("message"))
 
-        error_data = []
-        for error in response_body.get('Errors'):
-            error['error_id'] = error.pop('id')
-            if error.get('datetime', None):
-                # rename datetime to error_datetime because datetime is we have a class with the same name
-                error['error_datetime'] = error.pop('datetime')
-                error['error_datetime'] = self.str_to_datetime(
-                    error['error_datetime'])
+        shared = isinstance(response, CachedResponse)
+        return [self._to_error(error, shared) for error in response_body.get('Errors')]
 
-            error_data.append(error)
-        return [SiteError(**error) for error in error_data]
-
-    def _get_imports(self, site_id: int) -> list[SiteImport]:
+    @traced
+    def _get_imports(self, site_id: int, stream: bool = None) -> list[SiteImport]:  # type: ignore
         """gets last imports for a site.
 
         !Internal method
         
         Args:
             site_id (int): Site id
+            stream (bool, optional): decode the response while it is downloaded. Defaults to self.stream.
 
         Raises:
             pex.ProductsUpError: 
@@ -134,24 +260,22 @@ class Sites:
         Returns:
             list[SiteImport]: List of SiteImport objects
         """
+        if stream is None:
+            stream = self.stream
+        if stream:
+            return list(self.iter_imports(site_id))
 
         url = f"{Sites.BASE_URL}/sites/{site_id}/importhistory"
-        response = self.auth.make_request(url, method='get')
+        response = self.auth.make_request(url, method='get', revalidate=True)
         response_body = response.json()
         if not response_body.get("success", False):
-            raise pex.ProductsUpError(response["error"])
-        import_data = []
+            raise pex.ProductsUpError(response.status_code, response_body.get("message"))
         if not response_body.get('Importhistory'):
             return []
-        for import_ in response_body['Importhistory']:
-            import_['import_id'] = import_.pop('id')
-            import_['import_time'] = self.str_to_datetime(
-                import_['import_time'])
-            import_['import_time_utc'] = self.str_to_datetime(
-                import_['import_time_utc'])
-            import_data.append(import_)
-        return [SiteImport(**import_) for import_ in import_data]
+        shared = isinstance(response, CachedResponse)
+        return [self._to_import(import_, shared) for import_ in response_body['Importhistory']]
 
+    @traced
     def _construct_site(self, response, site_id: int) -> Site:
         """Construct a site object from the response
 
@@ -173,7 +297,8 @@ class Sites:
         site_data = site_data[0]
         site_data['site_id'] = site_data.pop('id')
         site_data['project'] = site_data.pop('project_id')
-        site_data['project'] = self.projects.get_project(site_data['project'])
+        site_data['project'] = self.projects.get_cached_project(
+            site_data['project'], build_index=self.use_index)
         site_data['created_at'] = self.str_to_datetime(
             date=site_data['created_at'])
         site_data['processing_status'] = SiteProcessingStatus(
@@ -186,11 +311,12 @@ class Sites:
         site_data['errors'] = self._get_errors(site_id)
         return Site(**site_data)
 
+    @traced
     def get_site(self, site_id: int) -> Site:
 
         url = f"{Sites.BASE_URL}/sites/{site_id}"
         try:
-            response = self.auth.make_request(url, method='get')
+            response = self.auth.make_request(url, method='get', idempotent=True)
         except pex.ProductsUpError as e:
             if e.status_code == 404:
                 raise pex.SiteNotFoundError(site_id=site_id)
@@ -198,6 +324,7 @@ class Sites:
                 raise e
         return self._construct_site(response=response, site_id=site_id)
 
+    @traced
     def get_all_sites(self) -> list[Site]:
 
         url = f"{Sites.BASE_URL}/sites"
@@ -218,6 +345,7 @@ class Sites:
 
         return [Site(**site_data) for site_data in sites_data]
 
+    @traced
     def create_site(self, project_id: int, title: str, import_schedule: str = None, reference: str = None,  # type: ignore
                     id_column: str = None, status: str = None) -> Site:  # type: ignore
         """Create a site
@@ -250,6 +378,7 @@ class Sites:
         response = self.auth.make_request(_url, method='post', data=data)
         return response
 
+    @traced
     def edit_site(self, site_id, title=None, reference=None,
                   project_id=None, id_column=None, status=None, import_schedule=None) -> Site:
         """Update a site information.
@@ -295,6 +424,7 @@ class Sites:
 
         return self._construct_site(response=response, site_id=site_id)
 
+    @traced
     def delete_site(self, site_id: int) -> bool:
         """Delete a site from the project.
 
@@ -319,6 +449,7 @@ class Sites:
         #
         pass
 
+    @traced
     def trigger_action(self, site_id: int, action: str = 'all') -> str:
         """Trigger a processing action. 
 
@@ -351,6 +482,7 @@ class Sites:
                 response.status_code, response_body.get("message"))
         return response_body.get("process_id")
 
+    @traced
     def get_status(self, site_id: int, pid: str) -> str:
         """Get the status of a process.
 
@@ -362,7 +494,8 @@ class Sites:
             str: The status of the process
         """
         _url = f"{Sites.BASE_URL}/sites/{site_id}/status/{pid}"
-        response = self.auth.make_request(_url, method='post')
+        # the status endpoint only reads the process state, it is safe to hedge
+        response = self.auth.make_request(_url, method='post', idempotent=True)
         response_body = response.json()
         status = response_body.get("status", 'unknown')
         return status
@@ -0,0 +1,167 @@
+# Author: Lyes Tarzalt
+import codecs
+import json
+from typing import Iterator
+
+from productsup_py.errors.productup_exception import ProductsUpError
+
+
+class _ArrayLocator:
+    """Scans a JSON document chunk by chunk until the array at `path` opens.
+
+    Only the position in the document is kept (the keys and indexes of the
+    containers we are in), the scanned text itself is dropped. The scalar
+    values of the top level `captured` keys ("success", "message") are kept
+    in `scalars`.
+    """
+
+    def __init__(self, path: tuple, captured: tuple = ('success', 'message')) -> None:
+        self.path = path
+        self.captured = captured
+        self.scalars = {}
+        # one frame per open container: [kind, key or index, expecting a key]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._is_key = False
+        # characters of the key or captured value being read, None when not collecting
+        self._chars = None
+        self._literal = False
+
+    def _captures_value(self) -> bool:
+        stack = self._stack
+        return len(stack) == 1 and stack[0][0] == 'object' and not stack[0][2] \
+            and stack[0][1] in self.captured
+
+    def feed(self, text: str) -> int:
+        """Scan a chunk of the document.
+
+        Returns:
+            int: position after the "[" of the array, -1 if not found yet
+        """
+        stack = self._stack
+        for position, char in enumerate(text):
+            if self._literal:
+                if char not in ',}] \t\r\n':
+                    self._chars.append(char)
+                    continue
+                # end of a captured true, false, null or number
+                self.scalars[stack[0][1]] = json.loads(''.join(self._chars))
+                self._chars, self._literal = None, False
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._chars is not None:
+                        value = json.loads('"' + ''.join(self._chars) + '"')
+                        if self._is_key:
+                            stack[-1][1] = value
+                        else:
+                            self.scalars[stack[0][1]] = value
+                        self._chars = None
+                    continue
+                if self._chars is not None:
+                    self._chars.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._is_key = bool(stack) and stack[-1][0] == 'object' and stack[-1][2]
+                if self._is_key or self._captures_value():
+                    self._chars = []
+            elif char in 'tfn-0123456789' and self._captures_value():
+                self._chars, self._literal = [char], True
+            elif char == '{':
+                stack.append(['object', None, True])
+            elif char == '[':
+                if tuple(frame[1] for frame in stack) == self.path:
+                    return position + 1
+                stack.append(['array', 0, False])
+            elif char == ':':
+                stack[-1][2] = False
+            elif char == ',':
+                if stack[-1][0] == 'object':
+                    stack[-1][1], stack[-1][2] = None, True
+                else:
+                    stack[-1][1] += 1
+            elif char in '}]':
+                stack.pop()
+        return -1
+
+
+def _check_success(response, locator: _ArrayLocator) -> None:
+    if locator.scalars.get('success', True) is False:
+        raise ProductsUpError(response.status_code, locator.scalars.get('message'))
+
+
+def iter_json_array(response, path: tuple, chunk_size: int = 64 * 1024) -> Iterator:
+    """Yield the items of an array of a JSON response, one at a time, without
+    reading the whole response in memory.
+
+    The response must be requested with stream=True.
+
+    Example:
+        {"success": true, "Channels": [{"history": [...]}]}
+        path ("Channels", 0, "history") yields the items of "history"
+
+    Args:
+        response (requests.Response): streamed response
+        path (tuple): keys and indexes leading to the array
+        chunk_size (int, optional): bytes read at once. Defaults to 64 KiB.
+
+    Raises:
+        ProductsUpError: the top level "success" of the response is false
+        json.JSONDecodeError: the response is not valid JSON
+
+    Yields:
+        the decoded items of the array, nothing if the array is not in the response
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    chunks = response.iter_content(chunk_size=chunk_size)
+    locator = _ArrayLocator(tuple(path))
+
+    buffer = ''
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        position = locator.feed(text)
+        if position != -1:
+            buffer = text[position:]
+            break
+    else:
+        _check_success(response, locator)
+        return
+    _check_success(response, locator)
+
+    json_decoder = json.JSONDecoder()
+    position = 0
+    exhausted = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                item, end = json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            else:
+                # a number is only complete once the character after it is read,
+                # "1" or "1." may go on as "1.5" in the next chunk
+                if exhausted or (end < len(buffer) and buffer[end] in ' \t\r\n,]'):
+                    position = end
+                    yield item
+                    continue
+        elif exhausted:
+            raise json.JSONDecodeError("Unterminated array", buffer, position)
+        # the next item is not complete yet, drop what was decoded and read more
+        buffer = buffer[position:]
+        position = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += decoder.decode(b'', final=True)
+            exhausted = True
+        else:
+            buffer += decoder.decode(chunk)
@@ -0,0 +1,281 @@
+# Author: Lyes Tarzalt
+import contextvars
+import functools
+import inspect
+import json
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Union
+
+from productsup_py.errors.productup_exception import RequestBudgetExceededError
+
+# (auth, trace) pairs of the traces opened in the current context
+_active_traces = contextvars.ContextVar('productsup_active_traces', default=())
+
+
+def active_traces(auth) -> list:
+    """Get the traces of a client opened in the current context."""
+    return [trace for owner, trace in _active_traces.get() if owner is auth]
+
+
+@contextmanager
+def activate_trace(auth, trace):
+    """Record the requests of a client made in the current context."""
+    token = _active_traces.set(_active_traces.get() + ((auth, trace),))
+    try:
+        yield trace
+    finally:
+        _active_traces.reset(token)
+
+
+@dataclass
+class Span:
+    """An operation (a method of Sites or Projects) or an HTTP request.
+
+    Times are in seconds since the start of the trace.
+    """
+
+    name: str
+    start: float
+    end: Union[float, None] = None
+    kind: str = 'operation'  # operation or http
+    thread_id: int = field(default_factory=threading.get_ident)
+    method: Union[str, None] = None
+    url: Union[str, None] = None
+    status_code: Union[int, None] = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    cache_hit: bool = False
+    children: list = field(default_factory=list, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else self.start) - self.start
+
+    @property
+    def request_count(self) -> int:
+        """Requests made by the span and its children."""
+        return (self.kind == 'http') + sum(child.request_count for child in self.children)
+
+    def walk(self, stack=()):
+        """Yield every span below this one with the names of its parents."""
+        stack = stack + (self.name,)
+        yield self, stack
+        for child in self.children:
+            yield from child.walk(stack)
+
+
+def _request_name(method: str, url: str) -> str:
+    """GET https://.../v2/sites/1234/errors -> GET /sites/{id}/errors"""
+    path = re.sub(r'^https?://[^/]+(/platform/v2)?', '', url)
+    path = re.sub(r'/[0-9a-fA-F]{32}(?=/|$)', '/{pid}', path)
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+    return f"{method.upper()} {path}"
+
+
+class Trace:
+    """Records the requests made by the operations run inside
+    `with auth.trace() as trace:`.
+
+    Only the requests made in the context that opened the trace are recorded,
+    the requests other threads make with the same client are not. Work sent
+    to a thread pool is recorded when it is run in a copy of the context
+    (contextvars.copy_context().run), as hedged requests and batch project
+    operations are. Requests are attached to the innermost operation.
+    """
+
+    def __init__(self, budget: int = None) -> None:  # type: ignore
+        """
+        Args:
+            budget (int, optional): maximum number of requests, the next one raises
+                RequestBudgetExceededError. Defaults to no limit.
+        """
+        self.budget = budget
+        self.request_count = 0
+        self._origin = time.perf_counter()
+        self.root = Span(name='trace', start=0.0)
+        self._current = contextvars.ContextVar(f'productsup-trace-{id(self)}', default=None)
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._origin
+
+    def _add(self, span: Span) -> None:
+        parent = self._current.get() or self.root
+        with self._lock:
+            parent.children.append(span)
+
+    def start_span(self, name: str) -> Span:
+        span = Span(name=name, start=self._now())
+        self._add(span)
+        return span
+
+    def end_span(self, span: Span) -> None:
+        span.end = self._now()
+
+    @contextmanager
+    def activate(self, span: Span):
+        """Attach the requests made inside to a span."""
+        token = self._current.set(span)
+        try:
+            yield span
+        finally:
+            self._current.reset(token)
+
+    @contextmanager
+    def span(self, name: str):
+        """Record an operation, the requests made inside are its children."""
+        span = self.start_span(name)
+        try:
+            with self.activate(span):
+                yield span
+        finally:
+            self.end_span(span)
+
+    def count_request(self, method: str, url: str) -> None:
+        """Count a request before it is sent.
+
+        Raises:
+            RequestBudgetExceededError: the request is over the budget
+        """
+        with self._lock:
+            self.request_count += 1
+            count = self.request_count
+        if self.budget is not None and count > self.budget:
+            raise RequestBudgetExceededError(
+                message=f"Request budget of {self.budget} exceeded by {method.upper()} {url}")
+
+    def record_request(self, method: str, url: str, start: float, response=None,
+                       bytes_sent: int = 0, cache_hit: bool = False) -> Span:
+        """Record a request that ended now.
+
+        Args:
+            method (str): method of the request
+            url (str): url of the request
+            start (float): time.perf_counter() when the request was sent
+            response (requests.Response, optional): response, None if the request failed
+            bytes_sent (int, optional): size of the body sent. Defaults to 0.
+            cache_hit (bool, optional): the body comes from a cache. Defaults to False.
+
+        Returns:
+            Span: the request, the body of a streamed response is not read yet and
+                its size is set by update_request
+        """
+        span = Span(name=_request_name(method, url), start=start - self._origin, end=self._now(),
+                    kind='http', method=method.upper(), url=url, bytes_sent=bytes_sent, cache_hit=cache_hit)
+        if response is not None:
+            span.status_code = response.status_code
+            if response.headers.get('Content-Length'):
+                span.bytes_received = int(response.headers['Content-Length'])
+            elif getattr(response, '_content_consumed', False):
+                span.bytes_received = len(response.content or b'')
+        self._add(span)
+        return span
+
+    def update_request(self, span: Span, bytes_received: int) -> None:
+        """Set the size and the end of a streamed request once its body is read."""
+        span.bytes_received = bytes_received
+        span.end = self._now()
+
+    def finish(self) -> None:
+        self.root.end = self._now()
+
+    @property
+    def spans(self) -> list:
+        return [span for span, _ in self.root.walk()][1:]
+
+    @property
+    def requests(self) -> list:
+        return [span for span in self.spans if span.kind == 'http']
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(span.bytes_received for span in self.requests)
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(span.cache_hit for span in self.requests)
+
+    def to_chrome_trace(self) -> dict:
+        """Export the trace in the Chrome trace event format, to open in
+        chrome://tracing or https://ui.perfetto.dev"""
+        events = []
+        for span, _ in self.root.walk():
+            event = {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": round(span.start * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": 1,
+                "tid": span.thread_id,
+                "args": {"requests": span.request_count},
+            }
+            if span.kind == 'http':
+                event["args"].update(url=span.url, status_code=span.status_code, bytes_sent=span.bytes_sent,
+                                     bytes_received=span.bytes_received, cache_hit=span.cache_hit)
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_folded(self) -> str:
+        """Export the trace as folded stacks (one "a;b;c microseconds" line
+        per span, self time only), the input of flamegraph.pl and speedscope."""
+        lines = []
+        for span, stack in self.root.walk():
+            self_time = span.duration - sum(child.duration for child in span.children)
+            if self_time > 0:
+                lines.append(f"{';'.join(stack)} {round(self_time * 1e6)}")
+        return "\n".join(lines) + "\n"
+
+    def save_chrome_trace(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_chrome_trace(), file)
+
+    def save_folded(self, path: str) -> None:
+        with open(path, 'w') as file:
+            file.write(self.to_folded())
+
+
+def traced(func):
+    """Record the calls of a Sites or Projects method in the active traces
+    of its client. A generator is recorded until it is exhausted or closed,
+    its requests are attached to it while it runs."""
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            traces = active_traces(self.auth)
+            if not traces:
+                yield from func(self, *args, **kwargs)
+                return
+            spans = [(trace, trace.start_span(func.__qualname__)) for trace in traces]
+            generator = func(self, *args, **kwargs)
+            try:
+                while True:
+                    with ExitStack() as stack:
+                        for trace, span in spans:
+                            stack.enter_context(trace.activate(span))
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                    yield item
+            finally:
+                generator.close()
+                for trace, span in spans:
+                    trace.end_span(span)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        traces = active_traces(self.auth)
+        if not traces:
+            return func(self, *args, **kwargs)
+        with ExitStack() as stack:
+            for trace in traces:
+                stack.enter_context(trace.span(func.__qualname__))
+            return func(self, *args, **kwargs)
+    return wrapper
@@ -13,6 +13,11 @@ setuptools.setup(
     install_requires=[
             "requests",
     ],
+    entry_points={
+        'console_scripts': [
+            'productsup=productsup_py.cli:main',
+        ],
+    },
     classifiers=[
         'License :: OSI Approved :: BSD License',
         'Intended Audience :: Developers',
@@ -0,0 +1,108 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from productsup_py.auth import ProductUpAuth
+from productsup_py.cache import CacheEntry, RevalidationCache, decoded_size
+from productsup_py.sites import Sites
+
+ERRORS = {"success": True, "Errors": [
+    {"id": i, "pid": "p", "error": 1, "data": [], "site_id": 1, "message": "m",
+     "datetime": "2023-01-01 00:00:00"} for i in range(3)]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    statuses = []
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            Handler.statuses.append(304)
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        Handler.statuses.append(200)
+        body = json.dumps(ERRORS).encode()
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sites(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(Sites, 'BASE_URL', f"http://127.0.0.1:{server.server_port}/platform/v2")
+    Handler.statuses = []
+    yield Sites(ProductUpAuth(1, 'secret', cache_entries=10))
+    server.shutdown()
+
+
+def entry(size):
+    return CacheEntry(etag='"e"', last_modified=None, body={}, size=size)
+
+
+def test_evicts_least_recently_used_entries():
+    cache = RevalidationCache(max_entries=2)
+    cache.put('a', entry(1))
+    cache.put('b', entry(1))
+    cache.get('a')
+    cache.put('c', entry(1))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_evicts_over_max_bytes():
+    cache = RevalidationCache(max_entries=10, max_bytes=100)
+    cache.put('a', entry(60))
+    cache.put('b', entry(60))
+    cache.put('too_big', entry(200))
+
+    assert len(cache) == 1 and cache.size == 60
+    assert cache.get('b') is not None
+
+
+def test_too_big_entry_removes_the_previous_one():
+    cache = RevalidationCache(max_entries=10, max_bytes=100)
+    cache.put('a', entry(60))
+    cache.put('a', entry(200))
+
+    assert cache.get('a') is None
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_decoded_size_counts_the_decoded_objects():
+    body = json.loads(json.dumps(ERRORS))
+    assert decoded_size(body) > len(json.dumps(ERRORS))
+
+
+def test_revalidates_and_keeps_the_cached_body_intact(sites):
+    results = [sites._get_errors(1) for _ in range(3)]
+
+    assert Handler.statuses == [200, 304, 304]
+    assert results[0] == results[1] == results[2]
+    assert [error.error_id for error in results[2]] == [0, 1, 2]
+    assert sites.auth.cache.hits == 2
+
+
+def test_streamed_records_are_renamed_in_place(sites):
+    record = {"id": 1, "pid": "p", "error": 1, "data": [], "site_id": 1, "message": "m"}
+    error = sites._to_error(record)
+
+    assert error.error_id == 1
+    assert record == {"error_id": 1, "pid": "p", "error": 1, "data": [], "site_id": 1, "message": "m"}
+
+
+def test_shared_records_are_not_modified(sites):
+    record = {"id": 1, "pid": "p", "error": 1, "data": [], "site_id": 1, "message": "m"}
+    sites._to_error(record, shared=True)
+
+    assert record["id"] == 1 and "error_id" not in record
@@ -0,0 +1,38 @@
+import json
+
+from productsup_py import cli
+from productsup_py.models import SiteError
+
+
+class FakeSites:
+
+    def __init__(self):
+        self.errors = {"1": [], "2": [SiteError(1, 'pid', 1, [], 2, 'message')]}
+
+    def iter_errors(self, site_id):
+        yield from self.errors[site_id]
+
+    def get_status(self, site_id, pid):
+        return 'success'
+
+
+def run(monkeypatch, capsys, argv):
+    monkeypatch.setattr(cli, '_sites', lambda args: FakeSites())
+    exit_code = cli.main(argv)
+    return exit_code, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_errors_only_writes_sites_with_new_errors(monkeypatch, capsys):
+    exit_code, records = run(monkeypatch, capsys, ['errors', '1', '2'])
+
+    assert exit_code == 0
+    assert [record['site_id'] for record in records] == ['2']
+    assert records[0]['errors'][0]['error_id'] == 1
+
+
+def test_wait_rejects_malformed_processes(monkeypatch, capsys):
+    exit_code, records = run(monkeypatch, capsys, ['wait', '1:abc', '2', ':abc'])
+
+    assert exit_code == 1
+    assert {record.get('status') for record in records} == {'success', None}
+    assert sorted(record['item'] for record in records if 'error' in record) == ['2', ':abc']
@@ -0,0 +1,129 @@
+import pytest
+import requests
+
+import productsup_py.errors as pex
+from productsup_py.pipeline import Pipeline
+
+
+class FakeSites:
+    """Processes are done after `polls` status calls."""
+
+    def __init__(self, polls=1, trigger_errors=None, status='success'):
+        self.polls = polls
+        self.trigger_errors = dict(trigger_errors or {})
+        self.status = status
+        self.calls = {}
+
+    def trigger_action(self, site_id, action):
+        errors = self.trigger_errors.get(site_id)
+        if errors:
+            raise errors.pop(0)
+        self.calls[site_id] = 0
+        return f"pid{site_id}"
+
+    def get_status(self, site_id, pid):
+        self.calls[site_id] += 1
+        return self.status if self.calls[site_id] >= self.polls else 'running'
+
+
+def make_pipeline(sites, **kwargs):
+    kwargs.setdefault('rate', 1000)
+    kwargs.setdefault('poll_interval', 0.001)
+    return Pipeline(sites, **kwargs)
+
+
+def test_runs_stages_after_their_dependencies():
+    pipeline = make_pipeline(FakeSites(polls=2))
+    pipeline.add_stage('a', 1, 'import')
+    pipeline.add_stage('b', 2, 'export-all', depends_on=['a'])
+    pipeline.add_stage('c', 3, depends_on=['a'])
+    pipeline.add_stage('d', 4, depends_on=['b', 'c'])
+
+    report = pipeline.run()
+
+    assert all(stage.status == 'done' for stage in report.stages.values())
+    assert report.stages['b'].started_at >= report.stages['a'].finished_at
+    assert report.critical_path[0] == 'a' and report.critical_path[-1] == 'd'
+
+
+def test_rejects_cycles_and_unknown_dependencies():
+    pipeline = make_pipeline(FakeSites())
+    pipeline.add_stage('a', 1, depends_on=['b'])
+    pipeline.add_stage('b', 2, depends_on=['a'])
+    with pytest.raises(ValueError):
+        pipeline.run()
+
+    pipeline = make_pipeline(FakeSites())
+    pipeline.add_stage('a', 1, depends_on=['missing'])
+    with pytest.raises(ValueError):
+        pipeline.run()
+
+
+def test_network_error_on_trigger_is_retried():
+    sites = FakeSites(trigger_errors={1: [requests.Timeout()]})
+    pipeline = make_pipeline(sites)
+    pipeline.add_stage('a', 1)
+
+    report = pipeline.run()
+
+    assert report.stages['a'].status == 'done'
+    assert report.stages['a'].attempts == 2
+
+
+def test_open_circuit_on_trigger_is_retried():
+    sites = FakeSites(trigger_errors={1: [pex.CircuitOpenError(message="Circuit open for 'process'")]})
+    pipeline = make_pipeline(sites)
+    pipeline.add_stage('a', 1)
+    pipeline.add_stage('b', 2, depends_on=['a'])
+
+    report = pipeline.run()
+
+    assert report.stages['b'].status == 'done'
+    assert report.stages['a'].attempts == 2
+
+
+def test_timings_are_taken_after_each_rate_limited_call():
+    pipeline = make_pipeline(FakeSites(), rate=20)
+    for site_id in range(4):
+        pipeline.add_stage(str(site_id), site_id)
+
+    report = pipeline.run()
+
+    started = [stage.started_at for stage in report.stages.values()]
+    finished = [stage.finished_at for stage in report.stages.values()]
+    # one request every 0.05s: the triggers and the polls are spread out
+    assert started == sorted(started) and started[-1] - started[0] >= 0.14
+    assert finished == sorted(finished) and finished[-1] - finished[0] >= 0.14
+
+
+def test_stage_fails_after_max_attempts_and_dependents_are_skipped():
+    sites = FakeSites(trigger_errors={1: [pex.TooManyRequestsError(429)] * 3})
+    pipeline = make_pipeline(sites, max_attempts=3)
+    pipeline.add_stage('a', 1)
+    pipeline.add_stage('b', 2, depends_on=['a'])
+
+    report = pipeline.run()
+
+    assert report.stages['a'].status == 'failed'
+    assert report.stages['b'].status == 'skipped'
+    assert [stage.name for stage in report.failed] == ['a', 'b']
+
+
+def test_unknown_status_fails_on_stage_timeout():
+    pipeline = make_pipeline(FakeSites(status='unknown'), stage_timeout=0.05)
+    pipeline.add_stage('a', 1)
+
+    report = pipeline.run()
+
+    assert report.stages['a'].status == 'failed'
+    assert 'Timed out' in report.stages['a'].error
+
+
+def test_pipeline_timeout_fails_remaining_stages():
+    pipeline = make_pipeline(FakeSites(status='unknown'), timeout=0.05)
+    pipeline.add_stage('a', 1)
+    pipeline.add_stage('b', 2, depends_on=['a'])
+
+    report = pipeline.run()
+
+    assert {stage.status for stage in report.stages.values()} == {'failed'}
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from productsup_py.pool import FairScheduler, ProductUpClientPool, RateLimiter
+
+
+def test_scheduler_serves_waiting_tenants_in_turn():
+    scheduler = FairScheduler(max_concurrency=1)
+    scheduler.acquire('busy')
+    served = []
+
+    def request(tenant):
+        scheduler.acquire(tenant)
+        served.append(tenant)
+        time.sleep(0.01)
+        scheduler.release()
+
+    threads = [threading.Thread(target=request, args=('busy',)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    quiet = threading.Thread(target=request, args=('quiet',))
+    quiet.start()
+    time.sleep(0.05)
+
+    scheduler.release()
+    for thread in threads + [quiet]:
+        thread.join()
+
+    # the quiet tenant waited last but is served second, not after the busy queue
+    assert served.index('quiet') == 1
+
+
+def test_scheduler_limits_concurrency():
+    scheduler = FairScheduler(max_concurrency=2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request(tenant):
+        scheduler.acquire(tenant)
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        scheduler.release()
+
+    threads = [threading.Thread(target=request, args=(i % 3,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=100)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+
+def test_pool_shares_the_session_between_clients():
+    pool = ProductUpClientPool()
+    first, second = pool.client(1, 'a'), pool.client(2, 'b')
+
+    assert first.session is second.session
+    assert pool.client(1, 'a') is first
+    assert first.get_token() != second.get_token()
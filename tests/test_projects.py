@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+import requests
+
+from productsup_py.projects import Projects
+from productsup_py.sites import Sites
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self._body = body
+
+    def json(self):
+        return json.loads(json.dumps(self._body))
+
+
+class FakeAuth:
+    """Answers the projects and sites listings, fails with `errors` by url."""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.requests = []
+
+    def make_request(self, url, method, data=None, **kwargs):
+        self.requests.append((method, url))
+        if url in self.errors:
+            raise self.errors[url]
+        if url == Projects.SITES_URL:
+            return FakeResponse({"success": True, "Sites": [
+                {"id": 1, "project_id": 10}, {"id": 2, "project_id": 10}, {"id": 3, "project_id": 11}]})
+        if method == 'delete':
+            return FakeResponse({"success": True})
+        if url == Projects.BASE_URL and method == 'get':
+            return FakeResponse({"success": True, "Projects": [
+                {"id": 10, "name": "a", "created_at": "2020-01-01", "links": []},
+                {"id": 11, "name": "b", "created_at": "2020-01-01", "links": []}]})
+        project_id = url.rsplit('/', 1)[-1] if url != Projects.BASE_URL else 12
+        name = json.loads(data)['name'] if data else 'p'
+        return FakeResponse({"success": True, "Projects": [
+            {"id": project_id, "name": name, "created_at": "2020-01-01", "links": []}]})
+
+
+def test_batch_keeps_network_errors_per_item():
+    auth = FakeAuth(errors={f"{Projects.BASE_URL}/2": requests.ConnectionError("down")})
+    results = Projects(auth).delete_projects([1, 2, 3])
+
+    assert [result.item for result in results] == [1, 2, 3]
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].error, requests.ConnectionError)
+
+
+def test_index_maps_projects_to_sites():
+    index = Projects(FakeAuth()).get_index()
+
+    assert index.get_sites(10) == [1, 2]
+    assert index.get_site_project(3).name == 'b'
+
+
+def test_concurrent_callers_build_the_index_once():
+    auth = FakeAuth()
+    make_request = auth.make_request
+
+    def slow_request(*args, **kwargs):
+        time.sleep(0.05)
+        return make_request(*args, **kwargs)
+
+    auth.make_request = slow_request
+    projects = Projects(auth)
+    threads = [threading.Thread(target=projects.get_project_sites, args=(10,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(auth.requests) == 2
+
+
+def test_single_operations_clear_the_index():
+    projects = Projects(FakeAuth())
+    projects.get_index()
+    projects.update_project(10, 'renamed')
+    assert projects._index is None
+
+    projects.get_index()
+    projects.delete_project(10)
+    assert projects._index is None
+
+
+def test_sites_resolve_projects_from_a_shared_index():
+    auth = FakeAuth()
+    projects = Projects(auth)
+    sites = Sites(auth, projects=projects, use_index=True)
+
+    project = sites.projects.get_cached_project(11, build_index=sites.use_index)
+    sites.projects.get_cached_project(10, build_index=sites.use_index)
+
+    assert sites.projects is projects
+    assert project.name == 'b'
+    assert len(auth.requests) == 2
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from productsup_py.auth import ProductUpAuth
+from productsup_py.errors import CircuitOpenError
+from productsup_py.resilience import CircuitBreaker, LatencyTracker, endpoint_family
+
+
+def test_endpoint_family():
+    assert endpoint_family("https://platform-api.productsup.io/platform/v2/sites/1/errors") == "sites"
+    assert endpoint_family("https://platform-api.productsup.io/platform/v2/process/1") == "process"
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('sites', failure_threshold=2, recovery_timeout=60)
+    breaker.before_request()
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_success()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker('sites', failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker('sites', failure_threshold=3, recovery_timeout=0.01)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_released_trial_can_be_retried():
+    breaker = CircuitBreaker('sites', failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.before_request()
+    breaker.release()
+    breaker.before_request()
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(min_samples=10)
+    for sample in range(9):
+        tracker.add(sample)
+    assert tracker.percentile(95) is None
+
+    for sample in range(9, 100):
+        tracker.add(sample)
+    assert tracker.percentile(95) == 95
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with Handler.lock:
+            Handler.requests += 1
+        time.sleep(0.1)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    # the 16 callers connect at once
+    request_queue_size = 64
+
+
+def test_concurrent_hedged_requests_are_not_queued():
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/platform/v2/sites/1"
+    auth = ProductUpAuth(1, 'secret', hedge_requests=True, hedge_delay=0.3, hedge_workers=4)
+    Handler.requests = 0
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=16) as callers:
+        list(callers.map(lambda _: auth.make_request(url, 'get', idempotent=True), range(32)))
+    elapsed = time.monotonic() - start
+    server.shutdown()
+
+    # more calls than hedge workers: none waits for a worker, so none is hedged
+    assert Handler.requests == 32
+    assert elapsed < 0.6
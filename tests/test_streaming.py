@@ -0,0 +1,106 @@
+import io
+import json
+
+import pytest
+import requests
+
+from productsup_py.auth import ProductUpAuth
+from productsup_py.errors import InternalServerError, ProductsUpError, TooManyRequestsError
+from productsup_py.sites import Sites
+from productsup_py.streaming import iter_json_array
+
+
+class FakeResponse:
+    """Streamed response returning the body in chunks of `chunk_size` bytes."""
+
+    encoding = None
+    status_code = 200
+
+    def __init__(self, body, chunk_size):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def stream(body, path, chunk_sizes=range(1, 17)):
+    """Decode the body with every chunk size and check they all agree."""
+    results = [list(iter_json_array(FakeResponse(body, size), path)) for size in chunk_sizes]
+    for result in results[1:]:
+        assert result == results[0]
+    return results[0]
+
+
+def test_numbers_are_not_cut_at_chunk_boundaries():
+    assert stream('{"Errors":[1,22,333,4444]}', ('Errors',)) == [1, 22, 333, 4444]
+
+
+def test_scalars():
+    body = '{"Errors": [true, false, null, -1.5e3, "a", ""]}'
+    assert stream(body, ('Errors',)) == [True, False, None, -1500.0, "a", ""]
+
+
+def test_objects_at_any_chunk_boundary():
+    records = [{"id": i, "message": "x" * i, "data": [i, {"n": None}]} for i in range(20)]
+    body = json.dumps({"success": True, "Errors": records})
+    assert stream(body, ('Errors',)) == records
+
+
+def test_escapes_and_brackets_in_strings():
+    records = [{"id": 1, "message": 'quote " backslash \\ ] } [ {', "key \"x\"": "é☃"}]
+    body = json.dumps({"success": True, "note": "] \" [", "we\"ird": [1, "]"], "Errors": records},
+                      ensure_ascii=False)
+    assert stream(body, ('Errors',)) == records
+
+
+def test_nested_path():
+    history = [{"id": 1}, {"id": 2}]
+    body = json.dumps({"success": True, "Channels": [{"history": history}, {"history": [{"id": 3}]}]})
+    assert stream(body, ('Channels', 0, 'history')) == history
+    assert stream(body, ('Channels', 1, 'history')) == [{"id": 3}]
+
+
+def test_missing_or_empty_array():
+    assert stream('{"success": true, "Errors": []}', ('Errors',)) == []
+    assert stream('{"success": true, "Importhistory": null}', ('Importhistory',)) == []
+
+
+def test_unsuccessful_response_raises():
+    body = '{"success": false, "message": "Site \\"1\\" not found"}'
+    for size in range(1, 17):
+        with pytest.raises(ProductsUpError) as error:
+            list(iter_json_array(FakeResponse(body, size), ('Errors',)))
+        assert error.value.message == 'Site "1" not found'
+
+
+def test_unsuccessful_response_with_array_raises():
+    with pytest.raises(ProductsUpError):
+        list(iter_json_array(FakeResponse('{"success":false,"Errors":[]}', 3), ('Errors',)))
+
+
+def test_truncated_response_raises():
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(FakeResponse('{"Errors":[{"id":1},{"id"', 4), ('Errors',)))
+
+
+def error_page(status_code, body):
+    def request(method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = status_code
+        response.raw = io.BytesIO(body)
+        response.url = url
+        return response
+    return request
+
+
+@pytest.mark.parametrize('status_code, exception', [
+    (502, ProductsUpError), (503, ProductsUpError), (429, TooManyRequestsError), (500, InternalServerError)])
+def test_streamed_error_page_raises(monkeypatch, status_code, exception):
+    auth = ProductUpAuth(1, 'secret')
+    monkeypatch.setattr(auth.session, 'request', error_page(status_code, b'<html>Bad Gateway</html>'))
+
+    with pytest.raises(exception) as error:
+        Sites(auth, stream=True)._get_errors(1)
+    assert error.value.status_code == status_code
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from productsup_py.auth import ProductUpAuth
+from productsup_py.errors import RequestBudgetExceededError
+from productsup_py.sites import Sites
+
+ERRORS = {"success": True, "Errors": [
+    {"id": i, "pid": "p", "error": 1, "data": [], "site_id": 1, "message": "m" * 100} for i in range(50)]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    slow = set()
+
+    def do_GET(self):
+        if self.path in Handler.slow:
+            Handler.slow.discard(self.path)
+            time.sleep(0.5)
+        body = json.dumps(ERRORS if self.path.endswith('/errors') else {"success": True}).encode()
+        self.send_response(200)
+        if not self.path.endswith('/errors'):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = self.path.endswith('/errors')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/platform/v2"
+    server.shutdown()
+
+
+def test_hedged_requests_are_counted(base_url):
+    auth = ProductUpAuth(1, 'secret', hedge_requests=True, hedge_delay=0.05)
+    Handler.slow.add('/platform/v2/sites/1')
+
+    with pytest.raises(RequestBudgetExceededError):
+        with auth.trace(budget=1):
+            auth.make_request(f"{base_url}/sites/1", 'get', idempotent=True)
+
+    Handler.slow.add('/platform/v2/sites/1')
+    with auth.trace() as trace:
+        auth.make_request(f"{base_url}/sites/1", 'get', idempotent=True)
+    assert trace.request_count == 2
+    # the slow copy is recorded once it ends
+    time.sleep(0.6)
+    assert len(trace.requests) == 2
+
+
+def test_streamed_bytes_are_recorded(base_url, monkeypatch):
+    monkeypatch.setattr(Sites, 'BASE_URL', base_url)
+    auth = ProductUpAuth(1, 'secret')
+
+    with auth.trace() as trace:
+        errors = list(Sites(auth).iter_errors(1))
+
+    assert len(errors) == 50
+    [span] = trace.root.children
+    assert span.name == 'Sites.iter_errors'
+    assert span.children[0].bytes_received == len(json.dumps(ERRORS))
+
+
+def test_other_threads_are_not_traced(base_url):
+    auth = ProductUpAuth(1, 'secret')
+
+    with auth.trace(budget=1) as trace:
+        other = threading.Thread(target=lambda: [auth.make_request(f"{base_url}/sites/2", 'get')
+                                                  for _ in range(3)])
+        other.start()
+        other.join()
+        auth.make_request(f"{base_url}/sites/1", 'get')
+
+    assert trace.request_count == 1